@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+
+import yaml
+
+from orderbook_manager import validate_period
+
+log = logging.getLogger('cfg')
+
+DEFAULT_RELOAD_PERIOD = 10
+
+
+class ConfigWatcher:
+    """ Polls the config file and hot reloads the orderbook manager's market
+    configs and the market data collector's scrapers when it changes,
+    requoting only the markets that changed. """
+
+    def __init__(self, path, obm, mdc, config):
+        self.path = path
+        self.obm = obm
+        self.mdc = mdc
+        self.config = config
+        self.reload_period = config.get('reload_period', DEFAULT_RELOAD_PERIOD)
+        self.digest = self.read_config()[1]
+
+    def read_config(self):
+        """ Returns the raw config file contents and their sha256 digest, or
+        (None, None) if the file can't be read right now. """
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+        except OSError:
+            return None, None
+        return raw, hashlib.sha256(raw).hexdigest()
+
+    def check_for_changes(self):
+        # Compare contents rather than mtimes, so a save that lands within
+        # the mtime granularity of a half-written read still gets picked up
+        raw, digest = self.read_config()
+        if digest is None or digest == self.digest:
+            return
+        log.info("%s changed, reloading...", self.path)
+        prev_config = self.obm.config
+        prev_market_configs = self.obm.market_configs
+        prev_mdc_config = self.mdc.config
+        prev_scrapers = self.mdc.scrapers
+        try:
+            config = yaml.safe_load(raw)
+            if not isinstance(config, dict):
+                raise ValueError("config is not a mapping")
+            mdc_config = config['market_data_collector']
+            if not isinstance(mdc_config, dict):
+                raise ValueError("market_data_collector config is not a mapping")
+            mdc_changed = mdc_config != prev_mdc_config
+            if mdc_changed:
+                for key in ('scrapers', 'update_period'):
+                    if key not in mdc_config:
+                        raise ValueError(
+                            f"market_data_collector config is missing {key}")
+                validate_period(mdc_config, 'update_period')
+                scrapers = self.mdc.load_scrapers(mdc_config)
+            changed = self.obm.reload_config(config['orderbook_manager'])
+        except OSError:
+            log.warning("Couldn't build scrapers, will retry the reload next poll",
+                        exc_info=True)
+            return
+        except (KeyError, TypeError, ValueError, yaml.YAMLError):
+            # These exact contents will never load, don't retry until they change
+            self.digest = digest
+            log.warning("Rejected invalid config, keeping the old one",
+                        exc_info=True)
+            return
+        if mdc_changed:
+            log.info("Market data collector config changed, refreshing tickers")
+            self.mdc.config = mdc_config
+            self.mdc.scrapers = scrapers
+            try:
+                # Newly added markets need prices before they can be quoted
+                self.mdc.update_tickers()
+                self.mdc.update_midpoints()
+                self.mdc.prune_datastore()
+            except Exception:
+                self.rollback(prev_config, prev_market_configs,
+                              prev_mdc_config, prev_scrapers)
+                log.warning("Ticker refresh with the new scrapers failed, "
+                            "rolled back to the old config; will retry the "
+                            "reload next poll", exc_info=True)
+                return
+        if not changed:
+            self.digest = digest
+            log.info("No market configs changed")
+            return
+        log.info("Market configs changed for %s", ", ".join(sorted(changed)))
+        try:
+            self.obm.requote_markets(changed)
+            self.digest = digest
+        except Exception:
+            # Markets that were already cancelled lost their rebalance
+            # baseline, so the next monitor cycle requotes them on the old config
+            self.rollback(prev_config, prev_market_configs,
+                          prev_mdc_config, prev_scrapers)
+            log.warning("Requote failed, rolled back to the old config; "
+                        "will retry the reload next poll",
+                        exc_info=True)
+
+    def rollback(self, obm_config, market_configs, mdc_config, scrapers):
+        self.obm.config = obm_config
+        self.obm.market_configs = market_configs
+        self.mdc.config = mdc_config
+        self.mdc.scrapers = scrapers
+
+    async def daemon(self):
+        log.info("Starting config watcher on %s; interval period %s sec",
+                 self.path, self.reload_period)
+        while True:
+            try:
+                self.check_for_changes()
+            except Exception:
+                log.warning("Config watcher loop exploded", exc_info=True)
+            await asyncio.sleep(self.reload_period)
@@ -4,6 +4,7 @@ import sys
 import click
 import logging as log
 
+from config_watcher import ConfigWatcher
 from market_data_collector import MarketDataCollector
 from orderbook_manager import OrderbookManager
 
@@ -27,11 +28,15 @@ def cli(ctx, config, endpoint, keyfile, verbose):
     root.addHandler(handler)
 
     hmac_key = keyfile.read().strip()
+    config_file = config
     config = yaml.load(config)
 
     ctx.obj['mdc'] = MarketDataCollector(config['market_data_collector'])
     ctx.obj['obm'] = OrderbookManager(
         endpoint, hmac_key, config['orderbook_manager'])
+    ctx.obj['cfg'] = ConfigWatcher(
+        config_file.name, ctx.obj['obm'], ctx.obj['mdc'],
+        config.get('config_watcher') or {})
 
 
 @cli.command()
@@ -41,6 +46,7 @@ def run(ctx):
     try:
         loop.create_task(ctx.obj['obm'].monitor())
         loop.create_task(ctx.obj['mdc'].daemon())
+        loop.create_task(ctx.obj['cfg'].daemon())
         loop.run_forever()
     except KeyboardInterrupt:
         pass
@@ -62,6 +68,7 @@ def mdc(ctx):
 def obm(ctx):
     loop = asyncio.get_event_loop()
     loop.create_task(ctx.obj['obm'].monitor())
+    loop.create_task(ctx.obj['cfg'].daemon())
     loop.run_forever()
 
 
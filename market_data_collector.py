@@ -19,10 +19,29 @@ class MarketDataCollector:
         # load config from yaml file
         self.config = config
         # load scrapers
-        self.scrapers = []
-        for name, cfg in self.config['scrapers'].items():
-            self.scrapers.append(
-                scraper_classes[name](exchange_name=name, **cfg))
+        self.scrapers = self.load_scrapers(config)
+
+    @staticmethod
+    def load_scrapers(config):
+        scrapers = []
+        if not isinstance(config['scrapers'], dict):
+            raise ValueError("scrapers is not a mapping")
+        for name, cfg in config['scrapers'].items():
+            if name not in scraper_classes:
+                raise ValueError(f"{name} is not a known scraper")
+            if not isinstance(cfg, dict):
+                raise ValueError(f"{name} scraper config is not a mapping")
+            scrapers.append(scraper_classes[name](exchange_name=name, **cfg))
+        return scrapers
+
+    def prune_datastore(self):
+        """ Drop the tickers and midpoints of exchanges we no longer scrape,
+        so their last prices don't linger as if they were current. """
+        names = {s.exchange_name for s in self.scrapers}
+        for data in (ExchangeDatastore.tickers, ExchangeDatastore.midpoints):
+            for exchange_name in set(data) - names:
+                log.info("Dropping stale %s market data", exchange_name)
+                del data[exchange_name]
 
     def update_tickers(self):
         log.debug("Updating tickers...")
@@ -50,3 +69,4 @@ class MarketDataCollector:
                 await asyncio.sleep(self.config["update_period"])
             except Exception:
                 log.warning("Market scraper loop exploded", exc_info=True)
+                await asyncio.sleep(self.config["update_period"])
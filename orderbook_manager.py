@@ -3,7 +3,7 @@ from typing import Union
 import asyncio
 import logging
 import heapq
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 
 from data_classes import ExchangeDatastore
 from qtrade_client.api import QtradeAPI, APIException
@@ -13,15 +13,86 @@ from pprint import pprint, pformat
 COIN = Decimal('.00000001')
 PERC = Decimal('.01')
 
+REQUIRED_CONFIG_KEYS = (
+    'markets', 'currency_reserves', 'monitor_period', 'price_tolerance',
+    'amount_tolerance', 'reserve_thresh_usd', 'dry_run_mode', 'cost_basis_btc')
+DECIMAL_CONFIG_KEYS = (
+    'price_tolerance', 'amount_tolerance', 'reserve_thresh_usd',
+    'cost_basis_btc')
+
 log = logging.getLogger('obm')
 
 
+def parse_decimal(value, name):
+    """ Convert a config value to a finite Decimal, raising ValueError
+    naming the setting if it isn't one. """
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"{name} {value} is not numeric")
+    if not value.is_finite():
+        raise ValueError(f"{name} {value} is not finite")
+    return value
+
+
+def validate_period(config, key):
+    """ Make sure an asyncio.sleep() period setting is a positive number. """
+    period = config[key]
+    if isinstance(period, bool) or not isinstance(period, (int, float)) \
+            or not period > 0:
+        raise ValueError(f"{key} {period} is not a positive number")
+
+
 class MarketConfig(dict):
 
     def __init__(self, market_string, config, default={}):
         self.market_string = market_string
         self.update(default)
         self.update(config)
+        self.ladders = self.compile_ladders()
+
+    def compile_ladders(self):
+        """ Validate the interval tables and convert them once into sorted
+        tuples of (slippage, ratio) Decimals, so the monitor loop doesn't
+        re-walk and re-convert the raw yaml dicts every cycle.
+        return {
+            "buy_limit": ((Decimal('0.03'), Decimal('0.1')), ...),
+            "sell_limit": ((Decimal('0.03'), Decimal('0.1')), ...),
+        }
+        """
+        intervals = self.get('intervals')
+        if not isinstance(intervals, dict):
+            raise ValueError(
+                f"{self.market_string} has no intervals configured")
+        ladders = {}
+        for order_type in ('buy_limit', 'sell_limit'):
+            table = intervals.get(order_type)
+            if not isinstance(table, dict):
+                raise ValueError(
+                    f"{self.market_string} has no {order_type} intervals")
+            ladder = []
+            for slip, ratio in table.items():
+                try:
+                    slip = Decimal(str(slip))
+                    ratio = Decimal(str(ratio))
+                except InvalidOperation:
+                    raise ValueError(
+                        f"{self.market_string} {order_type} interval "
+                        f"{slip}: {ratio} is not numeric")
+                if not slip.is_finite() or not ratio.is_finite():
+                    raise ValueError(
+                        f"{self.market_string} {order_type} interval "
+                        f"{slip}: {ratio} is not finite")
+                if slip < 0 or ratio < 0:
+                    raise ValueError(
+                        f"{self.market_string} {order_type} interval "
+                        f"{slip}: {ratio} is negative")
+                ladder.append((slip, ratio))
+            if sum(r for _, r in ladder) > 1:
+                raise ValueError(
+                    f"{self.market_string} {order_type} ratios sum to more than 1")
+            ladders[order_type] = tuple(sorted(ladder))
+        return ladders
 
 
 class OrderbookManager:
@@ -30,12 +101,120 @@ class OrderbookManager:
         self.config = config
         self.api = QtradeAPI(endpoint, key=key)
         self.prev_alloc_profile = None
-        self.market_configs = {
-            ms: MarketConfig(ms, mkt, default=config['markets'].get('default'))
-            for ms, mkt in config['markets'].items()
-            if ms != 'default'}
+        self.validate_settings(config)
+        self.market_configs = self.load_market_configs(config)
+        self.validate_market_configs(
+            self.market_configs, config['currency_reserves'])
+
+    @staticmethod
+    def load_market_configs(config):
+        markets = config['markets']
+        default = markets.get('default') or {}
+        return {ms: MarketConfig(ms, mkt, default=default)
+                for ms, mkt in markets.items()
+                if ms != 'default'}
+
+    def reload_config(self, config):
+        """ Swap in a freshly loaded orderbook_manager config. Only the market
+        configs whose settings differ are recompiled; unchanged ones are kept
+        as is. Raises ValueError without touching any state if the new config
+        is invalid. Returns the set of markets that were added, changed or
+        removed, including those whose coins had their reserve changed. """
+        self.validate_settings(config)
+        markets = config['markets']
+        default = markets.get('default') or {}
+        market_configs = {}
+        changed = set()
+        for ms, mkt in markets.items():
+            if ms == 'default':
+                continue
+            old = self.market_configs.get(ms)
+            merged = dict(default)
+            merged.update(mkt)
+            if old is not None and old == merged:
+                market_configs[ms] = old
+                continue
+            market_configs[ms] = MarketConfig(ms, mkt, default=default)
+            changed.add(ms)
+        changed.update(set(self.market_configs) - set(market_configs))
+        reserve_config = config['currency_reserves']
+        old_reserve_config = self.config['currency_reserves']
+        self.validate_market_configs(market_configs, reserve_config)
+        for ms in market_configs:
+            market = self.api.markets[ms]
+            for coin in (market['market_currency']['code'],
+                         market['base_currency']['code']):
+                if reserve_config[coin] != old_reserve_config.get(coin):
+                    changed.add(ms)
 
-    def compute_allocations(self):
+        self.config = config
+        self.market_configs = market_configs
+        return changed
+
+    @staticmethod
+    def validate_settings(config):
+        """ Make sure every global setting the orderbook manager reads is
+        present and usable. """
+        if not isinstance(config, dict):
+            raise ValueError("orderbook_manager config is not a mapping")
+        for key in REQUIRED_CONFIG_KEYS:
+            if key not in config:
+                raise ValueError(f"config is missing {key}")
+        for key in ('markets', 'currency_reserves'):
+            if not isinstance(config[key], dict):
+                raise ValueError(f"{key} is not a mapping")
+        for ms, mkt in config['markets'].items():
+            if not isinstance(mkt, dict) and not (ms == 'default' and mkt is None):
+                raise ValueError(f"{ms} market config is not a mapping")
+        for key in DECIMAL_CONFIG_KEYS:
+            parse_decimal(config[key], key)
+        validate_period(config, 'monitor_period')
+        if not isinstance(config['dry_run_mode'], bool):
+            raise ValueError(
+                f"dry_run_mode {config['dry_run_mode']} is not true or false")
+
+    def validate_market_configs(self, market_configs, reserve_config):
+        totals = {}
+        for mc in market_configs.values():
+            for coin, alloc_perc in self.validate_market_config(
+                    mc, reserve_config).items():
+                totals[coin] = totals.get(coin, 0) + alloc_perc
+        for coin, total in totals.items():
+            if total > 1:
+                raise ValueError(
+                    f"{coin} allocations across all markets sum to more than 1")
+
+    def validate_market_config(self, market_config, reserve_config):
+        """ Make sure compute_allocations will find an allocation percentage
+        and a reserve for both coins of the market. Returns the allocation
+        percentage of each coin. """
+        market_string = market_config.market_string
+        try:
+            market = self.api.markets[market_string]
+        except KeyError:
+            raise ValueError(f"{market_string} is not a known market")
+        allocs = {}
+        for coin in (market['market_currency']['code'],
+                     market['base_currency']['code']):
+            if coin not in market_config:
+                raise ValueError(
+                    f"{market_string} has no {coin} allocation configured")
+            if coin not in reserve_config:
+                raise ValueError(
+                    f"{market_string} has no {coin} currency reserve configured")
+            for value in (market_config[coin], reserve_config[coin]):
+                if parse_decimal(value, f"{market_string} {coin} setting") < 0:
+                    raise ValueError(
+                        f"{market_string} {coin} setting {value} is negative")
+            alloc_perc = parse_decimal(
+                market_config[coin], f"{market_string} {coin} allocation")
+            if alloc_perc > 1:
+                raise ValueError(
+                    f"{market_string} {coin} allocation {alloc_perc} is more than 1")
+            allocs[coin] = alloc_perc
+        return allocs
+
+    def compute_allocations(self, markets=None):
         """ Given our allocation % targets and our current balances, figure out
         how much market and base currency we would _ideally_ be
         allocating to each market
@@ -50,6 +229,8 @@ class OrderbookManager:
         reserve_config = self.config['currency_reserves']
         allocs = {}
         for market_string, market_alloc in self.market_configs.items():
+            if markets is not None and market_string not in markets:
+                continue
             market = self.api.markets[market_string]
 
             def allocate_coin(coin):
@@ -84,13 +265,11 @@ class OrderbookManager:
         """
         buy_allocs = []
         sell_allocs = []
-        mc = self.market_configs[market_string]
-        for slip, ratio in mc['intervals']['sell_limit'].items():
-            ratio = Decimal(ratio)
+        ladders = self.market_configs[market_string].ladders
+        for slip, ratio in ladders['sell_limit']:
             amount = (market_alloc * ratio).quantize(COIN)
             sell_allocs.append((slip, amount))
-        for slip, ratio in mc['intervals']['buy_limit'].items():
-            ratio = Decimal(ratio)
+        for slip, ratio in ladders['buy_limit']:
             value = (base_alloc * ratio).quantize(COIN)
             buy_allocs.append((slip, value))
         return {'buy_limit': buy_allocs, 'sell_limit': sell_allocs}
@@ -138,6 +317,35 @@ class OrderbookManager:
                 self.place_order('sell_limit', market_string, price, amount)
         self.prev_alloc_profile = allocation_profile
 
+    def requote_markets(self, markets):
+        """ Cancel and replace the orders of just the given markets, leaving
+        every other market's orders (and rebalance baseline) alone. """
+        if not markets:
+            return
+        if self.prev_alloc_profile is None:
+            # Nothing placed yet, the next monitor cycle does a full rebalance
+            return
+        allocation_profile = self.generate_allocation_profile(
+            markets & self.market_configs.keys())
+
+        if self.config['dry_run_mode']:
+            log.warning(
+                "You are in dry run mode! Orders will not be cancelled or placed!")
+            pprint(allocation_profile)
+            return
+
+        log.info("Requoting %s", ", ".join(sorted(markets)))
+        self.api.cancel_market_orders(*markets)
+        for market_string in markets:
+            self.prev_alloc_profile.pop(market_string, None)
+
+        for market_string, profile in allocation_profile.items():
+            for price, value in profile['buy_limit']:
+                self.place_order('buy_limit', market_string, price, value)
+            for price, amount in profile['sell_limit']:
+                self.place_order('sell_limit', market_string, price, amount)
+            self.prev_alloc_profile[market_string] = profile
+
     def place_order(self, order_type, market_string, price, quantity):
         if quantity <= 0:
             return
@@ -164,6 +372,9 @@ class OrderbookManager:
             return True
 
         for market, profile in allocation_profile.items():
+            if market not in self.prev_alloc_profile:
+                log.info("Rebalance! No previous rebalance data for %s!", market)
+                return True
             prev_profile = self.prev_alloc_profile[market]
             for t in ('buy_limit', 'sell_limit'):
                 for n, o in zip(profile[t], prev_profile[t]):
@@ -231,15 +442,22 @@ class OrderbookManager:
         return sorted_orders
 
     def generate_orders(self, force_rebalance=False):
-        allocs = self.compute_allocations()
+        allocation_profile = self.generate_allocation_profile()
+        self.rebalance_orders(allocation_profile,
+                              self.get_orders(), force=force_rebalance)
+
+    def generate_allocation_profile(self, markets=None):
+        allocs = self.compute_allocations(markets)
         allocation_profile = {}
         for market, (market_amount, base_amount) in allocs.items():
-            if market in ExchangeDatastore.tickers['bittrex'].keys():
-                bid = ExchangeDatastore.tickers['bittrex'][market]['bid']
-                ask = ExchangeDatastore.tickers['bittrex'][market]['ask']
-            elif market in ExchangeDatastore.tickers['ccxt'].keys():
-                bid = ExchangeDatastore.tickers['ccxt'][market]['bid']
-                ask = ExchangeDatastore.tickers['ccxt'][market]['ask']
+            bittrex = ExchangeDatastore.tickers.get('bittrex', {})
+            ccxt = ExchangeDatastore.tickers.get('ccxt', {})
+            if market in bittrex.keys():
+                bid = bittrex[market]['bid']
+                ask = bittrex[market]['ask']
+            elif market in ccxt.keys():
+                bid = ccxt[market]['bid']
+                ask = ccxt[market]['ask']
             else:
                 log.warning(f"Can't get bid/ask price for {market} to generate orders!")
                 continue
@@ -247,8 +465,7 @@ class OrderbookManager:
                      market, bid, ask)
             allocation_profile[market] = self.price_orders(
                 self.allocate_orders(market_amount, base_amount, market), bid, ask)
-        self.rebalance_orders(allocation_profile,
-                              self.get_orders(), force=force_rebalance)
+        return allocation_profile
 
     def estimate_account_value(self):
         # convert all coin values to BTC using the Bittrex bid price
@@ -325,3 +542,4 @@ class OrderbookManager:
                 log.warning("Orderbook manager loop exploded", exc_info=True)
                 # Just in case the entire program explodes, so that we don't have orders out.
                 self.api.cancel_market_orders()
+                await asyncio.sleep(self.config['monitor_period'])
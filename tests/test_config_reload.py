@@ -0,0 +1,202 @@
+import copy
+from decimal import Decimal
+
+import pytest
+import yaml
+
+pytest.importorskip('qtrade_client')
+
+import orderbook_manager  # noqa: E402
+from config_watcher import ConfigWatcher  # noqa: E402
+from orderbook_manager import MarketConfig, OrderbookManager  # noqa: E402
+
+LADDER = {0.05: 0.5, 0.03: 0.5}
+
+CONFIG = {
+    'markets': {
+        'LTC_BTC': {'BTC': .5, 'LTC': 1},
+        'DOGE_BTC': {'BTC': .5, 'DOGE': 1},
+        'default': {
+            'intervals': {'buy_limit': LADDER, 'sell_limit': LADDER},
+        },
+    },
+    'currency_reserves': {'BTC': 0.1, 'LTC': 0.1, 'DOGE': 0.1},
+    'monitor_period': 300,
+    'reserve_thresh_usd': 1.00,
+    'price_tolerance': .01,
+    'amount_tolerance': .05,
+    'dry_run_mode': True,
+    'cost_basis_btc': 0.1,
+}
+
+
+class FakeQtradeAPI:
+
+    def __init__(self, endpoint, key=None):
+        self.markets = {
+            c + '_BTC': {'market_currency': {'code': c},
+                         'base_currency': {'code': 'BTC'}}
+            for c in ('LTC', 'DOGE', 'XMR')}
+
+
+class FakeMarketDataCollector:
+
+    def __init__(self, config):
+        self.config = config
+        self.scrapers = []
+
+
+@pytest.fixture
+def config():
+    return copy.deepcopy(CONFIG)
+
+
+@pytest.fixture
+def obm(monkeypatch, config):
+    monkeypatch.setattr(orderbook_manager, 'QtradeAPI', FakeQtradeAPI)
+    return OrderbookManager('endpoint', 'key', copy.deepcopy(config))
+
+
+def test_compile_ladders_sorts_decimals():
+    mc = MarketConfig('LTC_BTC', {}, default=CONFIG['markets']['default'])
+    assert mc.ladders['buy_limit'] == (
+        (Decimal('0.03'), Decimal('0.5')), (Decimal('0.05'), Decimal('0.5')))
+
+
+@pytest.mark.parametrize('table', [
+    {0.03: 'nan'},
+    {'inf': 0.1},
+    {0.03: -0.1},
+    {0.03: 'abc'},
+    {0.03: 0.6, 0.05: 0.6},
+])
+def test_compile_ladders_rejects_bad_intervals(table):
+    with pytest.raises(ValueError):
+        MarketConfig('LTC_BTC', {'intervals': {
+            'buy_limit': table, 'sell_limit': LADDER}})
+
+
+def test_compile_ladders_requires_intervals():
+    with pytest.raises(ValueError):
+        MarketConfig('LTC_BTC', {'BTC': .5})
+
+
+def test_reload_unchanged_keeps_market_configs(obm, config):
+    before = dict(obm.market_configs)
+    assert obm.reload_config(copy.deepcopy(config)) == set()
+    for ms, mc in obm.market_configs.items():
+        assert mc is before[ms]
+
+
+def test_reload_recompiles_only_changed_market(obm, config):
+    doge = obm.market_configs['DOGE_BTC']
+    config['markets']['LTC_BTC']['BTC'] = .25
+    assert obm.reload_config(config) == {'LTC_BTC'}
+    assert obm.market_configs['DOGE_BTC'] is doge
+    assert obm.market_configs['LTC_BTC']['BTC'] == .25
+
+
+def test_reload_reports_added_and_removed_markets(obm, config):
+    del config['markets']['DOGE_BTC']
+    config['markets']['XMR_BTC'] = {'BTC': .5, 'XMR': 1}
+    config['currency_reserves']['XMR'] = 0.1
+    assert obm.reload_config(config) == {'DOGE_BTC', 'XMR_BTC'}
+    assert set(obm.market_configs) == {'LTC_BTC', 'XMR_BTC'}
+
+
+def test_reload_reports_markets_with_changed_reserves(obm, config):
+    config['currency_reserves']['LTC'] = 0.5
+    assert obm.reload_config(config) == {'LTC_BTC'}
+    config = copy.deepcopy(config)
+    config['currency_reserves']['BTC'] = 0.5
+    assert obm.reload_config(config) == {'LTC_BTC', 'DOGE_BTC'}
+
+
+@pytest.mark.parametrize('mutate', [
+    lambda c: c.pop('monitor_period'),
+    lambda c: c.update(monitor_period='5m'),
+    lambda c: c.update(price_tolerance='abc'),
+    lambda c: c.update(dry_run_mode='yes'),
+    lambda c: c.update(markets=[1, 2]),
+    lambda c: c['markets'].update(XMR_BTC={'BTC': 0}),
+    lambda c: c['markets']['LTC_BTC'].update(BTC=5),
+    lambda c: c['markets']['LTC_BTC'].update(BTC=.75),
+    lambda c: c['currency_reserves'].pop('LTC'),
+])
+def test_reload_rejects_invalid_config(obm, config, mutate):
+    prev_config = obm.config
+    prev_market_configs = obm.market_configs
+    mutate(config)
+    with pytest.raises(ValueError):
+        obm.reload_config(config)
+    assert obm.config is prev_config
+    assert obm.market_configs is prev_market_configs
+
+
+def test_construction_rejects_invalid_config(monkeypatch, config):
+    monkeypatch.setattr(orderbook_manager, 'QtradeAPI', FakeQtradeAPI)
+    del config['currency_reserves']['DOGE']
+    with pytest.raises(ValueError):
+        OrderbookManager('endpoint', 'key', config)
+
+
+@pytest.fixture
+def watcher(tmp_path, obm, config):
+    path = tmp_path / 'config.yml'
+    mdc_config = {'update_period': 300, 'scrapers': {}}
+    path.write_text(yaml.safe_dump(
+        {'orderbook_manager': config, 'market_data_collector': mdc_config}))
+    return ConfigWatcher(
+        str(path), obm, FakeMarketDataCollector(mdc_config), {})
+
+
+def write_config(watcher, config):
+    with open(watcher.path, 'w') as f:
+        yaml.safe_dump({'orderbook_manager': config,
+                        'market_data_collector': watcher.mdc.config}, f)
+
+
+def test_watcher_requotes_changed_markets(watcher, config):
+    requoted = []
+    watcher.obm.requote_markets = requoted.append
+    config['markets']['LTC_BTC']['BTC'] = .25
+    write_config(watcher, config)
+    watcher.check_for_changes()
+    assert requoted == [{'LTC_BTC'}]
+    watcher.check_for_changes()
+    assert requoted == [{'LTC_BTC'}]
+
+
+def test_watcher_ignores_invalid_config_until_it_changes(watcher, config):
+    prev_market_configs = watcher.obm.market_configs
+    with open(watcher.path, 'w') as f:
+        f.write('orderbook_manager: [')
+    watcher.check_for_changes()
+    assert watcher.obm.market_configs is prev_market_configs
+    config['markets']['LTC_BTC']['BTC'] = .25
+    write_config(watcher, config)
+    watcher.check_for_changes()
+    assert watcher.obm.market_configs['LTC_BTC']['BTC'] == .25
+
+
+def test_watcher_rolls_back_failed_requote(watcher, config):
+    prev_config = watcher.obm.config
+    prev_market_configs = watcher.obm.market_configs
+    attempts = []
+
+    def requote_markets(markets):
+        attempts.append(markets)
+        raise RuntimeError("network down")
+
+    watcher.obm.requote_markets = requote_markets
+    config['markets']['LTC_BTC']['BTC'] = .25
+    write_config(watcher, config)
+    watcher.check_for_changes()
+    assert watcher.obm.config is prev_config
+    assert watcher.obm.market_configs is prev_market_configs
+
+    # The same file is retried on the next poll
+    watcher.obm.requote_markets = attempts.append
+    watcher.check_for_changes()
+    assert attempts == [{'LTC_BTC'}, {'LTC_BTC'}]
+    assert watcher.obm.market_configs['LTC_BTC']['BTC'] == .25